@@ -1,21 +1,15 @@
-from machine import ADC
-from piotimer import Piotimer
 from time import ticks_ms, ticks_diff, sleep
-from fifo import Fifo
 import json
 from history import save_entry, get_timestamp
 
 class HRVAnalyzer:
-    def __init__(self, adc_pin=26, window_size=250):
-        self.adc = ADC(adc_pin)  
-        self.sample_rate = 250
+    def __init__(self, sampler, window_size=250):
+        self.sampler = sampler  # shared adc sampler
+        self.sample_rate = sampler.sample_rate
         self.window_size = window_size 
-        self.fifo = Fifo(500)  
+        # windows are read in place, the rest of the buffer is room for the irq meanwhile
+        assert 2 * window_size <= sampler.size, "window_size must be at most half of sampler.size"
         self.peaks = []  # list to store peak indices
-        self.index = 0  # Global index of samples read from FIFO
-
-    def handler(self, tid):
-        self.fifo.put(self.adc.read_u16()) 
 
     def calculate_hrv(self, peaks):
         if len(peaks) < 2:
@@ -38,55 +32,77 @@ class HRVAnalyzer:
         
     def run(self, oled, sw, duration=30, mqtt_client=None):
         last_slope = None
-        timer = Piotimer(mode=Piotimer.PERIODIC, freq=self.sample_rate, callback=self.handler)  # Piotimer
         min_peak_distance = int(0.4 * self.sample_rate)  
         start = ticks_ms()
         last_peak_index = -1000  # initialize as far away
         countdown = duration
+        self.peaks = []  # sample positions restart with every run
 
         oled.fill(0)
         oled.text("Sampling HRV...", 0, 0)
         oled.show()
 
-        while ticks_diff(ticks_ms(), start) < duration * 1000:
-            # allow user to cancel with SW_2
-            if not sw.fifo.empty():
-                if sw.fifo.get() == 0:
-                    timer.deinit()
-                    oled.fill(0)
-                    oled.text("HRV Cancelled", 0, 20)
-                    oled.show()
-                    sleep(0.5)
-                    return
+        reader = self.sampler.open()  # own read cursor on the shared sampler
+        try:
+            while ticks_diff(ticks_ms(), start) < duration * 1000:
+                # allow user to cancel with SW_2
+                if not sw.fifo.empty():
+                    if sw.fifo.get() == 0:
+                        oled.fill(0)
+                        oled.text("HRV Cancelled", 0, 20)
+                        oled.show()
+                        sleep(0.5)
+                        return
 
-            # wait until at least 1 second of data (250 samples)
-            if (self.fifo.head - self.fifo.tail + self.fifo.size) % self.fifo.size < self.window_size:
-                continue
+                # wait until at least 1 second of data (window_size samples)
+                if reader.available() < self.window_size:
+                    continue
 
-            window = [self.fifo.get() for _ in range(250)]
-            threshold = min(window) + 0.85 * (max(window) - min(window))
-            for i in range(1, len(window) - 1):
-                prev = window[i - 1]
-                curr = window[i]
-                slope = curr - prev
-                if last_slope is not None and last_slope >= 0 and slope < 0 and prev > threshold:
-                    abs_index = self.index + i - len(window) # absolute sample index
-                    if abs_index - last_peak_index > min_peak_distance:
-                        self.peaks.append(abs_index)
-                        last_peak_index = abs_index
-                last_slope = slope
-            self.index += len(window)
+                # process the window in place in the sampler buffer
+                n = self.window_size
+                base = reader.tail  # absolute sample position of the window start
+                low = high = reader.peek(0)
+                for i in range(1, n):
+                    v = reader.peek(i)
+                    if v < low:
+                        low = v
+                    elif v > high:
+                        high = v
+                threshold = low + 0.85 * (high - low)
+                for i in range(1, n - 1):
+                    prev = reader.peek(i - 1)
+                    curr = reader.peek(i)
+                    slope = curr - prev
+                    if last_slope is not None and last_slope >= 0 and slope < 0 and prev > threshold:
+                        abs_index = base + i  # absolute sample index
+                        if abs_index - last_peak_index > min_peak_distance:
+                            self.peaks.append(abs_index)
+                            last_peak_index = abs_index
+                    last_slope = slope
+                reader.advance(n)
 
-            # countdown display update
-            time_passed = int(ticks_diff(ticks_ms(), start) / 1000)
-            if countdown != (duration - time_passed):
-                countdown = duration - time_passed
-                oled.fill(0)
-                oled.text("Collecting...", 0, 0)
-                oled.text(f"{countdown}s", 0, 20)
-                oled.show()
+                # countdown display update
+                time_passed = int(ticks_diff(ticks_ms(), start) / 1000)
+                if countdown != (duration - time_passed):
+                    countdown = duration - time_passed
+                    oled.fill(0)
+                    oled.text("Collecting...", 0, 0)
+                    oled.text(f"{countdown}s", 0, 20)
+                    oled.show()
+            overruns = reader.overruns
+        finally:
+            reader.close()
 
-        timer.deinit()
+        # lost samples break the peak intervals, so don't report or save them
+        if overruns:
+            print("HRV: lost", overruns, "samples, result discarded")
+            oled.fill(0)
+            oled.text("Samples lost", 0, 20)
+            oled.text("SW_2 to exit", 0, 54)
+            oled.show()
+            while True:
+                if not sw.fifo.empty() and sw.fifo.get() == 0:
+                    return
 
         # final hrv results
         mean_ppi, mean_hr, rmssd, sdnn = self.calculate_hrv(self.peaks)
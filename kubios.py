@@ -1,69 +1,79 @@
-from machine import ADC
-from piotimer import Piotimer
 from time import ticks_ms, ticks_diff
-from fifo import Fifo
 import ujson as json
 from mqtt_publish import connect_mqtt  # mqtt connection on port 21883
 
-def collect_ppi(oled, sw, duration=30, sample_rate=250):
-    adc = ADC(26)
-    fifo = Fifo(500)
+def collect_ppi(oled, sw, sampler, duration=30):
+    sample_rate = sampler.sample_rate
+    window_size = sample_rate  # 1 second windows
+    # windows are read in place, the rest of the buffer is room for the irq meanwhile
+    assert 2 * window_size <= sampler.size, "sampler.size must hold two seconds of samples"
     peaks = []
-    index = 0
     min_peak_distance = int(0.4 * sample_rate)
     last_peak_index = -1000
     last_slope = None
 
-    def handler(tid):
-        fifo.put(adc.read_u16())
-
-    tmr = Piotimer(mode=Piotimer.PERIODIC, freq=sample_rate, callback=handler)
     start = ticks_ms()
     countdown = duration
 
-    while ticks_diff(ticks_ms(), start) < duration * 1000:
-        if not sw.fifo.empty() and sw.fifo.get() == 0:
-            tmr.deinit()
-            return None
-
-        if (fifo.head - fifo.tail + fifo.size) % fifo.size < 250:
-            continue
-
-        window = [fifo.get() for _ in range(250)]
-        threshold = min(window) + 0.85 * (max(window) - min(window))
-        for i in range(1, len(window) - 1):
-            prev = window[i - 1]
-            curr = window[i]
-            slope = curr - prev
-            if last_slope is not None and last_slope >= 0 and slope < 0 and prev > threshold:
-                abs_index = index + i - len(window)
-                if abs_index - last_peak_index > min_peak_distance:
-                    peaks.append(abs_index)
-                    last_peak_index = abs_index
-            last_slope = slope
-        index += len(window)
-
-        time_passed = int(ticks_diff(ticks_ms(), start) / 1000)
-        if countdown != (duration - time_passed):
-            countdown = duration - time_passed
-            oled.fill(0)
-            oled.text("Collecting...", 0, 0)
-            oled.text(f"{countdown}s", 0, 20)
-            oled.show()
+    reader = sampler.open()  # own read cursor on the shared sampler
+    try:
+        while ticks_diff(ticks_ms(), start) < duration * 1000:
+            if not sw.fifo.empty() and sw.fifo.get() == 0:
+                return None
+
+            if reader.available() < window_size:
+                continue
+
+            # process the window in place in the sampler buffer
+            base = reader.tail  # absolute sample position of the window start
+            low = high = reader.peek(0)
+            for i in range(1, window_size):
+                v = reader.peek(i)
+                if v < low:
+                    low = v
+                elif v > high:
+                    high = v
+            threshold = low + 0.85 * (high - low)
+            for i in range(1, window_size - 1):
+                prev = reader.peek(i - 1)
+                curr = reader.peek(i)
+                slope = curr - prev
+                if last_slope is not None and last_slope >= 0 and slope < 0 and prev > threshold:
+                    abs_index = base + i
+                    if abs_index - last_peak_index > min_peak_distance:
+                        peaks.append(abs_index)
+                        last_peak_index = abs_index
+                last_slope = slope
+            reader.advance(window_size)
+
+            time_passed = int(ticks_diff(ticks_ms(), start) / 1000)
+            if countdown != (duration - time_passed):
+                countdown = duration - time_passed
+                oled.fill(0)
+                oled.text("Collecting...", 0, 0)
+                oled.text(f"{countdown}s", 0, 20)
+                oled.show()
+        overruns = reader.overruns
+    finally:
+        reader.close()
+
+    # lost samples break the peak intervals, so the ppi list is not usable
+    if overruns:
+        print("Kubios: lost", overruns, "samples, ppi discarded")
+        return None
 
-    tmr.deinit()
     ppi = [int((peaks[i] - peaks[i - 1]) * 1000 / sample_rate) for i in range(1, len(peaks))]
     print("Collected PPI:", ppi)
     return ppi
 
 # send ppi data to kubios cloud service for hrv analysis
-def kubios_mode(oled, sw): 
+def kubios_mode(oled, sw, sampler): 
     oled.fill(0)
     oled.text("Collecting...", 0, 0)
     oled.show()
 
     # ------step1: collect ppi
-    ppi = collect_ppi(oled, sw)
+    ppi = collect_ppi(oled, sw, sampler)
     if ppi is None or len(ppi) < 5:
         oled.fill(0)
         oled.text("Cancelled", 0, 0)
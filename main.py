@@ -2,6 +2,7 @@ from machine import Pin, I2C
 from time import ticks_ms, ticks_diff
 from ssd1306 import SSD1306_I2C
 from fifo import Fifo
+from sampler import Sampler
 from hr_measure import Measurement
 from hrv_analyze import HRVAnalyzer
 from history import show_history
@@ -64,8 +65,9 @@ class Sw:
 
 sw = Sw(9, 7)  # sw0 for Start, sw2 for Stop
 
-hr = Measurement(26)     # Hr measure instance
-hrv = HRVAnalyzer(26)    # Hrv analyze instance
+sampler = Sampler(26)         # one timer + adc on pin 26 shared by all modes
+hr = Measurement(sampler)     # Hr measure instance
+hrv = HRVAnalyzer(sampler)    # Hrv analyze instance
 
 # Display startup screen
 def show_start_screen():
@@ -149,7 +151,7 @@ while True:
                     in_menu = True
                     
                 elif selected == 3:
-                    kubios_mode(oled, sw) 
+                    kubios_mode(oled, sw, sampler) 
                     show_stop_screen()
                     while sw.sw0.value():
                         pass
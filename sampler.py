@@ -0,0 +1,88 @@
+from machine import ADC
+from piotimer import Piotimer
+from array import array
+
+# One timer + ADC for the whole program. The interrupt writes into a shared ring
+# buffer and every consumer (hr detector, display, hrv, recorder...) reads it
+# through its own Reader, so running several of them costs one interrupt stream.
+class Sampler:
+    def __init__(self, adc_pin=26, size=500, sample_rate=250):
+        self.adc = ADC(adc_pin)
+        self.size = size
+        self.sample_rate = sample_rate
+        self.buffer = array("H", bytes(2 * size))  # preallocated, no heap use in the irq
+        self.head = 0  # total samples written, only changed by the handler
+        self.readers = 0
+        self.timer = None
+
+    def handler(self, tid):
+        self.buffer[self.head % self.size] = self.adc.read_u16()
+        self.head += 1
+
+    # start sampling on the first reader, new readers start at the newest sample
+    def open(self):
+        if self.timer is None:
+            self.head = 0  # restart the count so it stays a small int
+            self.timer = Piotimer(mode=Piotimer.PERIODIC, freq=self.sample_rate, callback=self.handler)
+        self.readers += 1
+        return Reader(self)
+
+    # stop the timer when the last reader is closed
+    def release(self):
+        self.readers -= 1
+        if self.readers <= 0 and self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+            self.readers = 0
+
+
+# Read cursor into the sampler buffer, one per consumer.
+# The writer never waits for readers: a reader that falls more than one buffer
+# behind skips to the oldest sample still stored and counts the lost ones.
+class Reader:
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.tail = sampler.head  # absolute position of the next sample to read
+        self.overruns = 0  # number of samples lost because this reader was too slow
+        self.closed = False
+
+    def available(self):
+        lag = self.sampler.head - self.tail
+        limit = self.sampler.size - 1  # one free slot, so the irq can write once between this check and a read
+        if lag > limit:
+            self.overruns += lag - limit
+            self.tail += lag - limit
+            lag = limit
+        return lag
+
+    def empty(self):
+        return self.available() == 0
+
+    def get(self):
+        if self.available() == 0:
+            raise RuntimeError("Sampler reader is empty")
+        s = self.sampler
+        value = s.buffer[self.tail % s.size]
+        self.tail += 1
+        return value
+
+    # i-th unread sample, read in place without moving the cursor.
+    # Call available() first and keep i below it.
+    def peek(self, i):
+        s = self.sampler
+        return s.buffer[(self.tail + i) % s.size]
+
+    # consume n peeked samples; returns False if the irq overwrote some of them meanwhile
+    def advance(self, n):
+        s = self.sampler
+        lost = s.head - self.tail - (s.size - 1)  # peeked slots the irq has written over
+        if lost > 0:
+            self.overruns += min(lost, n)  # anything past the window is counted by available()
+        self.tail += n
+        self.available()
+        return lost <= 0
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sampler.release()